@@ -31,6 +31,7 @@ def pytest_sessionfinish(session, exitstatus):
 
 
 @pytest.fixture(scope='function', autouse=True)
-def new_file():
-    """Create a new file before each test."""
-    cmds.file(new=True, force=True)
+def new_file(request):
+    """Create a new file before each test, unless marked with reuse_scene."""
+    if request.node.get_closest_marker('reuse_scene') is None:
+        cmds.file(new=True, force=True)
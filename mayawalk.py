@@ -11,6 +11,20 @@ __version__ = '0.1.0'
 
 _LOG = logging.getLogger(__name__)
 
+_world_cache = None
+
+# Normal attributes of each node type id, see `._attributes`.
+_normal_attributes = {}
+
+
+def _world():
+    """MObject: Returns the world node, looked up once per session."""
+    global _world_cache
+    if _world_cache is None or not _world_cache.isValid():
+        world = OpenMaya.MItDependencyNodes(OpenMaya.MFn.kWorld).thisNode()
+        _world_cache = OpenMaya.MObjectHandle(world)
+    return _world_cache.object()
+
 
 class ConnectionStatus(object):
     """All connections status a plug can have. Enum class."""
@@ -33,6 +47,16 @@ class ConnectionStatus(object):
     kDisconnectedDestinations = 6
     """Has no destinations / is not a source."""
 
+    # Only the plug property relevant to the status is queried.
+    _checks = {
+        kConnected: lambda plug: plug.isConnected,
+        kConnectedSources: lambda plug: plug.isDestination,
+        kConnectedDestinations: lambda plug: plug.isSource,
+        kDisconnected: lambda plug: not plug.isConnected,
+        kDisconnectedSources: lambda plug: not plug.isDestination,
+        kDisconnectedDestinations: lambda plug: not plug.isSource,
+    }
+
     @classmethod
     def has_status(cls, plug, connection):
         """
@@ -43,16 +67,8 @@ class ConnectionStatus(object):
         Returns:
             bool: True if ``plug`` has ``connection`` status, False otherwise.
         """
-        if any((
-                connection == cls.kConnected and not plug.isConnected,
-                connection == cls.kConnectedDestinations and not plug.isSource,
-                connection == cls.kConnectedSources and not plug.isDestination,
-                connection == cls.kDisconnected and plug.isConnected,
-                connection == cls.kDisconnectedDestinations and plug.isSource,
-                connection == cls.kDisconnectedSources and plug.isDestination,
-            )):
-            return False
-        return True
+        check = cls._checks.get(connection)
+        return check(plug) if check else True
 
 
 def parent(node, include_world=False):
@@ -82,10 +98,8 @@ def parent(node, include_world=False):
     except RuntimeError:  # Node has no parent (is probably the world node).
         return None
 
-    if not include_world:
-        world = OpenMaya.MItDependencyNodes(OpenMaya.MFn.kWorld).thisNode()
-        if parent_mob == world:
-            return None
+    if not include_world and parent_mob == _world():
+        return None
     return parent_mob
 
 
@@ -152,8 +166,9 @@ def siblings(node, api_type=None):
         # node is the world node, it has no parent and no siblings.
         return
 
-    world = OpenMaya.MItDependencyNodes(OpenMaya.MFn.kWorld).thisNode()
-    parent_is_world = parent_mob == world
+    # Attached to a child only when checking default nodes, below.
+    parent_is_world = parent_mob == _world()
+    child_dag = OpenMaya.MFnDagNode()
 
     parent_dag = OpenMaya.MFnDagNode(parent_mob)
     for index in range(parent_dag.childCount()):
@@ -163,15 +178,17 @@ def siblings(node, api_type=None):
 
         # If iterating siblings at root level, don't yield the 'default' nodes
         # automatically created by Maya and invisibles in outliner.
-        if parent_is_world and OpenMaya.MFnDagNode(child).isDefaultNode:
-            continue
+        if parent_is_world:
+            child_dag.setObject(child)
+            if child_dag.isDefaultNode:
+                continue
 
         if not api_type or child.hasFn(api_type):
             yield child
 
 
 def hierarchy(root, stoppers=None, api_type=None, depth_first=False,
-              upstream=False):
+              upstream=False, max_depth=None):
     """Traverse ``root`` hierarchy.
 
     Info:
@@ -186,10 +203,12 @@ def hierarchy(root, stoppers=None, api_type=None, depth_first=False,
         depth_first (bool): Traversal algorithm.
             Use *depth-first search* if True, *breadth-first search* if False.
             Defaults to False.
-        downstream (bool): Traversal direction.
+        upstream (bool): Traversal direction.
             Go *upstream* (parents) if True, *downstream* (children) if False.
             The ``depth_first`` param has no effect when going upstream.
             Defaults to False.
+        max_depth (int, None): Don't iterate past nodes at this depth, ``root``
+            being at depth 0. Defaults to None (no limit).
 
     Yields:
         MObject: Nodes in ``root`` (**included**) hierarchy.
@@ -205,24 +224,73 @@ def hierarchy(root, stoppers=None, api_type=None, depth_first=False,
         True
         >>> list(hierarchy(shape, upstream=True)) == [shape, node_a, root]
         True
+        >>> list(hierarchy(root, max_depth=1)) == [root, node_a, node_b]
+        True
     """
-    def parents(node):
-        """Returns node parent as a list, or an empty list if has no parents."""
-        parent_mob = parent(node, include_world=False)
-        return [parent_mob] if parent_mob is not None else []
+    nodes = _hierarchy(root, stoppers, depth_first, upstream, max_depth)
+    return _filtered(nodes, api_type)
 
-    stoppers = stoppers or []
-    stack = deque([root])
-    while stack:
-        current = stack.pop() if depth_first else stack.popleft()
 
-        if not api_type or current.hasFn(api_type):
+def _hierarchy(root, stoppers, depth_first, upstream, max_depth):
+    """Implementation of `.hierarchy`, without ``api_type`` filtering."""
+    # Bound once, this is looked up for every visited node.
+    get_handle = OpenMaya.MObjectHandle
+
+    def relatives(node):
+        """list[tuple[MObject, int]]: Returns ``node`` relatives and hashes.
+
+        The relatives are ``node`` parent if ``upstream``, its children if not.
+        """
+        if upstream:
+            parent_mob = parent(node, include_world=False)
+            found = [parent_mob] if parent_mob is not None else []
+        else:
+            found = children(node)
+        return [(mob, get_handle(mob).hashCode()) for mob in found]
+
+    # Nodes are stacked with their hash, computed once when they are found.
+    stoppers = set(get_handle(node).hashCode() for node in stoppers or [])
+    root_hash = get_handle(root).hashCode()
+
+    if depth_first:
+        stack = [(root, root_hash, 0)]
+        pop, push = stack.pop, stack.extend
+        while stack:
+            current, current_hash, depth = pop()
             yield current
 
-        if current in stoppers:
-            continue
+            if current_hash in stoppers or depth == max_depth:
+                continue
+
+            push((node, node_hash, depth + 1)
+                 for node, node_hash in relatives(current))
+        return
+
+    # Breadth first, level by level.
+    frontier = [(root, root_hash)]
+    depth = 0
+    while frontier:
+        next_frontier = []
+        push = next_frontier.extend
+        for current, current_hash in frontier:
+            yield current
+
+            if current_hash in stoppers or depth == max_depth:
+                continue
+
+            push(relatives(current))
+        frontier = next_frontier
+        depth += 1
 
-        stack.extend(parents(current) if upstream else children(current))
+
+def _filtered(nodes, api_type):
+    """Return ``nodes`` iterator, filtered by ``api_type`` if specified.
+
+    The filter is chosen once, so unfiltered traversals don't check each node.
+    """
+    if not api_type:
+        return nodes
+    return (node for node in nodes if node.hasFn(api_type))
 
 
 def top_nodes(nodes, sparse=False):
@@ -252,17 +320,45 @@ def top_nodes(nodes, sparse=False):
         >>> list(top_nodes([node_a, node_c], sparse=True)) == [node_a]
         True
     """
-    if sparse:
-        def parents(node):
-            return itertools.islice(hierarchy(node, upstream=True), 1, None)
-    else:
-        def parents(node):
-            parent_mob = parent(node, include_world=False)
-            return [parent_mob] if parent_mob is not None else []
+    def get_hash(mobject):
+        """int: Returns ``mobject`` unique hash."""
+        return OpenMaya.MObjectHandle(mobject).hashCode()
+
+    def has_parent_in_nodes(node):
+        """bool: Returns True if ``node`` parent is in ``nodes``."""
+        parent_mob = parent(node, include_world=False)
+        return parent_mob is not None and get_hash(parent_mob) in node_hashes
+
+    def has_ancestor_in_nodes(node):
+        """bool: Returns True if any ``node`` ancestor is in ``nodes``.
+
+        Nodes often share ancestors, so the answer is stored in ``covered``
+        for every ancestor walked, and reused by the next walks reaching them.
+        """
+        walked = []
+        found = False
+        current = parent(node, include_world=False)
+        while current is not None:
+            current_hash = get_hash(current)
+            if current_hash in node_hashes:
+                found = True
+                break
+            if current_hash in covered:
+                found = covered[current_hash]
+                break
+            walked.append(current_hash)
+            current = parent(current, include_world=False)
+
+        for ancestor_hash in walked:
+            covered[ancestor_hash] = found
+        return found
 
     nodes = list(nodes)
+    node_hashes = set(get_hash(node) for node in nodes)
+    covered = {}
+    is_covered = has_ancestor_in_nodes if sparse else has_parent_in_nodes
     for node in nodes:
-        if not any(parent in nodes for parent in parents(node)):
+        if not is_covered(node):
             yield node
 
 
@@ -309,53 +405,84 @@ def connections(root, stoppers=None, api_type=None, depth_first=False, upstream=
         >>> list(connections(node_a, stoppers=[node_b])) == [node_a, node_b]
         True
     """
-    stoppers = stoppers or []
+    nodes = _connections(root, stoppers, depth_first, upstream)
+    return _filtered(nodes, api_type)
+
+
+def _connections(root, stoppers, depth_first, upstream):
+    """Implementation of `.connections`, without ``api_type`` filtering."""
+    stoppers = set(
+        OpenMaya.MObjectHandle(node).hashCode() for node in stoppers or [])
     visited = set()
 
-    def get_hash(mobject):
-        """int: Returns ``mobject`` unique hash."""
-        return OpenMaya.MObjectHandle(mobject).hashCode()
+    # Indexes of the sources / destinations lists returned by `._adjacent`.
+    forward = 0 if upstream else 1
+    opposite = 1 - forward
 
-    def sources(node):
-        """MObject: Yields sources nodes connected to ``node``."""
-        return connected(node, sources=True, destinations=False)
-
-    def destinations(node):
-        """MObject: Yields destinations nodes connected to ``node``."""
-        return connected(node, sources=False, destinations=True)
-
-    def has_unvisited_connections(node):
-        """bool: Returns True if ``node`` is connected to an unvisited node"""
-        opposite_connections = destinations if upstream else sources
-        if node != root:
-            for src in opposite_connections(node):
-                if src == node:
-                    continue
-                if get_hash(src) not in visited:
-                    return True
+    def neighbours(node, node_hash):
+        """tuple[list, list]: Returns ``node`` sources and destinations.
+
+        Breadth first needs both directions, they are queried in a single pass
+        and cached until ``node`` is visited.
+        """
+        found = adjacency.get(node_hash)
+        if found is None:
+            both = not depth_first
+            found = _adjacent(node, sources=upstream or both,
+                              destinations=not upstream or both)
+            adjacency[node_hash] = found
+        return found
+
+    def has_unvisited_connections(node, node_hash):
+        """bool: Returns True if ``node`` is connected to an unvisited node.
+
+        Opposite connections of ``node`` are only queried on the first check
+        and kept in ``pending``. Visited hashes are trimmed from the end of the
+        list, so each hash is dropped once over all the checks of ``node``.
+        """
+        if node_hash == root_hash:
+            return False
+
+        unvisited = pending.get(node_hash)
+        if unvisited is None:
+            opposite_connections = neighbours(node, node_hash)[opposite]
+            unvisited = pending[node_hash] = [
+                src_hash for _, src_hash in opposite_connections
+                if src_hash != node_hash]
+
+        while unvisited and unvisited[-1] in visited:
+            unvisited.pop()
+        if unvisited:
+            return True
+        del pending[node_hash]
         return False
 
-    stack = deque([root])
+    # Nodes are stacked with their hash, so it is computed once per connection.
+    root_hash = OpenMaya.MObjectHandle(root).hashCode()
+    adjacency = {}
+    pending = {}
+    stack = deque([(root, root_hash)])
+    pop = stack.pop if depth_first else stack.popleft
+    push, visit = stack.extend, visited.add
     while stack:
-        current = stack.pop() if depth_first else stack.popleft()
-        current_hash = get_hash(current)
+        current, current_hash = pop()
 
         if current_hash in visited:  # Cycle.
             continue
 
         # Can be visited too soon if breadth_first.
-        if not depth_first and has_unvisited_connections(current):
+        if not depth_first and has_unvisited_connections(current, current_hash):
             continue
 
-        if not api_type or current.hasFn(api_type):
-            yield current
-
-        visited.add(current_hash)
+        yield current
+        visit(current_hash)
 
-        if current in stoppers:
+        if current_hash in stoppers:
+            adjacency.pop(current_hash, None)
             continue
 
-        stack.extend(sources(current) if upstream else destinations(current))
+        push(neighbours(current, current_hash)[forward])
+        del adjacency[current_hash]
 
 
 def connected(node, sources=True, destinations=True):  # , api_type=None
@@ -384,25 +511,58 @@ def connected(node, sources=True, destinations=True):  # , api_type=None
         True
     """
     # TODO add MFn filtering ?
+    found_sources, found_destinations = _adjacent(node, sources, destinations)
     visited = set()
-    if sources:
-        for plug in plugs(node, connection=ConnectionStatus.kConnectedSources):
-            node = plug.sourceWithConversion().node()
-            node_hash = OpenMaya.MObjectHandle(node).hashCode()
-            if node_hash not in visited:
-                # if not api_type or node.hasFn(api_type):
-                yield node
-                visited.add(node_hash)
-
-    if destinations:
-        for plug in plugs(node, connection=ConnectionStatus.kConnectedDestinations):
+    for other, other_hash in itertools.chain(found_sources, found_destinations):
+        if other_hash not in visited:
+            # if not api_type or other.hasFn(api_type):
+            yield other
+            visited.add(other_hash)
+
+
+def _adjacent(node, sources=True, destinations=True):
+    """Return nodes connected to ``node``, split by direction.
+
+    Both directions are collected in a single pass over ``node`` connected
+    plugs.
+
+    Args:
+        node (MObject): Node to find the connections of.
+        sources (bool): Collect ``node`` sources. Defaults to True.
+        destinations (bool): Collect ``node`` destinations. Defaults to True.
+
+    Returns:
+        tuple[list, list]: Unique sources and destinations of ``node``, as
+        ``(MObject, hash)`` tuples.
+    """
+    found_sources, found_destinations = [], []
+    if sources and destinations:
+        connection = ConnectionStatus.kConnected
+    elif sources:
+        connection = ConnectionStatus.kConnectedSources
+    elif destinations:
+        connection = ConnectionStatus.kConnectedDestinations
+    else:
+        return found_sources, found_destinations
+
+    visited_sources, visited_destinations = set(), set()
+    for plug in plugs(node, connection=connection):
+        if sources and plug.isDestination:
+            other = plug.sourceWithConversion().node()
+            other_hash = OpenMaya.MObjectHandle(other).hashCode()
+            if other_hash not in visited_sources:
+                found_sources.append((other, other_hash))
+                visited_sources.add(other_hash)
+
+        if destinations and plug.isSource:
             for dest in plug.destinationsWithConversions():
-                node = dest.node()
-                node_hash = OpenMaya.MObjectHandle(node).hashCode()
-                if node_hash not in visited:
-                    # if not api_type or node.hasFn(api_type):
-                    yield node
-                    visited.add(node_hash)
+                other = dest.node()
+                other_hash = OpenMaya.MObjectHandle(other).hashCode()
+                if other_hash not in visited_destinations:
+                    found_destinations.append((other, other_hash))
+                    visited_destinations.add(other_hash)
+
+    return found_sources, found_destinations
 
 
 def plugs(node, connection=None):
@@ -414,7 +574,8 @@ def plugs(node, connection=None):
             `.ConnectionStatus`. Defaults to None.
 
     Yields:
-        MPlug: Plugs of ``node``.
+        MPlug: Plugs of ``node``. Plugs of a connected status are yielded in
+        the order of ``node`` connections, other plugs in attributes order.
     """
     # # Attributes Classes filter.  # TODO filter by attr_class ?
     # kAttrDynamic = OpenMaya.MFnDependencyNode.kLocalDynamicAttr  #: User attrs. 1
@@ -423,23 +584,84 @@ def plugs(node, connection=None):
     # kAttrInvalid = OpenMaya.MFnDependencyNode.kInvalidAttr  # 4
 
     dep = OpenMaya.MFnDependencyNode(node)
-    for index in range(dep.attributeCount()):
-        # attr_mob = dep.attribute(index)
-        # if attr_class and dep.attributeClass(attr_mob) != attr_class:
+
+    # Connected plugs are queried at once instead of walking all attributes.
+    if connection in (ConnectionStatus.kConnected,
+                      ConnectionStatus.kConnectedSources,
+                      ConnectionStatus.kConnectedDestinations):
+        for plug in dep.getConnections():
+            # Plugs nested under an array element, like a[0].b, are skipped
+            # the same way as their [-1] placeholder in the attributes walk.
+            array = plug.array() if plug.isElement else plug
+            if array.isChild and '[' in array.name():
+                continue
+            if ConnectionStatus.has_status(plug, connection):
+                yield plug
+        return
+
+    for attribute in _attributes(dep):
+        # if attr_class and dep.attributeClass(attribute) != attr_class:
         #     continue
 
-        plug = dep.findPlug(dep.attribute(index), False)
+        plug = dep.findPlug(attribute, False)
 
         # Maya sometime crash when we try to access [-1] indexes.
-        if '[-1]' in plug.name():
+        # Only a child plug can have a [-1] index (in its array ancestors),
+        # check that first to avoid building most plug names.
+        if plug.isChild and '[-1]' in plug.name():
             _LOG.debug('Ignoring placeholder index plug %s', plug.name())
             continue
 
+        if not connection or ConnectionStatus.has_status(plug, connection):
+            yield plug
+
         # Include children if is array (Compound children are already included).
-        childplugs = plug_children(plug) if plug.isArray else []
-        for plg in itertools.chain([plug], childplugs):
-            if not connection or ConnectionStatus.has_status(plg, connection):
-                yield plg
+        if plug.isArray:
+            for child in _array_children(plug):
+                if not connection or ConnectionStatus.has_status(child, connection):
+                    yield child
+
+
+def _attributes(dep):
+    """Make an iterator returning the attributes of ``dep`` node.
+
+    Normal attributes are shared by all nodes of a type, so they are queried
+    once per type id and cached. Extension and dynamic attributes come after
+    them and are queried for each node, since they can be added and deleted.
+
+    Args:
+        dep (MFnDependencyNode): Function set attached to the node.
+
+    Yields:
+        MObject: Attributes of the node, in index order.
+    """
+    kNormal = OpenMaya.MFnDependencyNode.kNormalAttr
+    type_id = dep.typeId.id()
+    count = dep.attributeCount()
+    normal = _normal_attributes.get(type_id)
+
+    # The last attribute is the type's own, inherited ones come first. It no
+    # longer matches when the type is recreated (plugin reloaded).
+    if normal is not None:
+        last = len(normal) - 1
+        if last >= count or not dep.attribute(last) == normal[-1]:
+            normal = None
+
+    if normal is None:
+        normal = []
+        for index in range(count):
+            attribute = dep.attribute(index)
+            if dep.attributeClass(attribute) != kNormal:
+                break
+            normal.append(attribute)
+        normal = tuple(normal)
+        if normal:
+            _normal_attributes[type_id] = normal
+
+    for attribute in normal:
+        yield attribute
+    for index in range(len(normal), count):
+        yield dep.attribute(index)
 
 
 def plug_parent(plug):
@@ -508,29 +730,42 @@ def plug_children(plug, reverse=False, physical_indexes=False):  # connection=No
     # A plug can be array and compound at the same time. If this is the case, we
     # treat is as an array. Its children elements are the real compounds.
     if plug.isArray:
+        return _array_children(plug, reverse, physical_indexes)
+    elif plug.isCompound:
+        return _compound_children(plug, reverse)
+    return iter(())
+
+
+def _array_children(plug, reverse=False, physical_indexes=False):
+    """`.plug_children` of a ``plug`` known to be an array."""
+    # Some array plugs don't have physical indexes. For example:
+    # {OpenMaya.MFn.kAnimCurve: (
+    #     'keyTanLocked', 'keyWeightLocked', 'keyTanInX', 'keyTanInY',
+    #     'keyTanOutX', 'keyTanOutY', 'keyTanInType', 'keyTanOutType',
+    #     'keyBreakdown', 'keyTickDrawSpecial')}
+    if not OpenMaya.MFnAttribute(plug.attribute()).connectable:
+        _LOG.debug('Ignoring non-physical plug %s', plug.name())
+        return iter(())
+
+    if physical_indexes:
+        get_child = plug.elementByPhysicalIndex
+    else:
+        get_child = plug.elementByLogicalIndex
+    return _indexed_children(
+        plug, get_child, plug.evaluateNumElements(), reverse)
 
-        # Some array plugs don't have physical indexes. For example:
-        # {OpenMaya.MFn.kAnimCurve: (
-        #     'keyTanLocked', 'keyWeightLocked', 'keyTanInX', 'keyTanInY',
-        #     'keyTanOutX', 'keyTanOutY', 'keyTanInType', 'keyTanOutType',
-        #     'keyBreakdown', 'keyTickDrawSpecial')}
-        if not OpenMaya.MFnAttribute(plug.attribute()).connectable:
-            _LOG.debug('Ignoring non-physical plug %s', plug.name())
-            return
-
-        if physical_indexes:
-            get_child = plug.elementByPhysicalIndex
-        else:
-            get_child = plug.elementByLogicalIndex
-        child_count = plug.evaluateNumElements()
 
-    elif plug.isCompound:
-        get_child = plug.child
-        child_count = plug.numChildren()
+def _compound_children(plug, reverse=False):
+    """`.plug_children` of a ``plug`` known to be a compound."""
+    return _indexed_children(plug, plug.child, plug.numChildren(), reverse)
 
-    else:
-        return
 
+def _indexed_children(plug, get_child, child_count, reverse):
+    """Make an iterator returning ``get_child(index)`` for each child index.
+
+    Raises:
+        IndexError: Unknown error when trying to get a child plug.
+    """
     indexes = range(child_count - 1, -1, -1) if reverse else range(child_count)
     for index in indexes:
         try:
@@ -553,13 +788,10 @@ def plug_has_source(plug, nested=False):
     Returns:
         bool:
     """
-    stack = deque([plug])
-    while stack:
-        plug = stack.pop()
-        if plug.isDestination:
-            return True
-        if nested:
-            stack.extend(plug_children(plug))
+    if plug.isDestination:
+        return True
+    if nested:
+        return any(plug_has_source(child, nested) for child in plug_children(plug))
     return False
 
 
@@ -573,21 +805,19 @@ def plug_has_destinations(plug, nested=False):
     Returns:
         bool:
     """
-    stack = deque([plug])
-    while stack:
-        plug = stack.pop()
-        if plug.isSource:
-            return True
-        if nested:
-            stack.extend(plug_children(plug))
+    if plug.isSource:
+        return True
+    if nested:
+        return any(
+            plug_has_destinations(child, nested) for child in plug_children(plug))
     return False
 
 
 def plug_has_connections(plug, nested=False):
     """Return True if ``plug`` has any source or destination connection.
 
-    Convenience function that run both `.plug_has_source` and
-    `.plug_has_destinations`.
+    Same as running both `.plug_has_source` and `.plug_has_destinations`, in a
+    single walk of ``plug`` hierarchy.
 
     Args:
         nested (bool): If True, extend the check to all children in ``plug``
@@ -596,4 +826,9 @@ def plug_has_connections(plug, nested=False):
     Returns:
         bool:
     """
-    return plug_has_source(plug, nested) or plug_has_destinations(plug, nested)
+    if plug.isConnected:
+        return True
+    if nested:
+        return any(
+            plug_has_connections(child, nested) for child in plug_children(plug))
+    return False
@@ -1,5 +1,6 @@
 from __future__ import division, absolute_import, print_function
 
+import pytest
 from maya.api import OpenMaya
 
 import mayawalk
@@ -7,13 +8,42 @@ import mayawalk
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 # Helpers
 
+_kDagNode = OpenMaya.MFn.kDagNode
+_kNurbsCurve = OpenMaya.MFn.kNurbsCurve
+_kJoint = OpenMaya.MFn.kJoint
+_kTransform = OpenMaya.MFn.kTransform
+
+# Node types created under a new transform when they have no parent.
+_SHAPE_TYPES = frozenset((
+    'nurbsCurve', 'nurbsSurface', 'mesh', 'locator', 'camera'))
+
+# Node types that can only be created by a MDagModifier.
+_DAG_TYPES = frozenset(('transform', 'joint')) | _SHAPE_TYPES
+
+_TRANSLATE_XYZ = ('translateX', 'translateY', 'translateZ')
+_TRANSLATE_ZYX = _TRANSLATE_XYZ[::-1]
+
+
+def rename_shape(modifier, node_mob, name):
+    # A shape created without parent is returned with the transform Maya
+    # creates for it, the shape being its only child.
+    shape = OpenMaya.MFnDagNode(node_mob).child(0)
+    modifier.renameNode(shape, name + 'Shape')
+
 
 def create_node(node_type, parent=None, name=None):
     args = [node_type, parent] if parent is not None else [node_type]
-    try:  # Try to create a dependency node.
+
+    if node_type in _DAG_TYPES:
+        modifier = OpenMaya.MDagModifier()
+    else:
         modifier = OpenMaya.MDGModifier()
+
+    try:
         node_mob = modifier.createNode(*args)
-    except TypeError:  # invalid node type (or invalid modifier)
+    except TypeError:  # invalid node type (or dag type missing from the table)
+        if node_type in _DAG_TYPES:
+            raise TypeError('Invalid node type: {}.'.format(node_type))
         try:  # Try to create a dag node.
             modifier = OpenMaya.MDagModifier()
             node_mob = modifier.createNode(*args)
@@ -23,137 +53,370 @@ def create_node(node_type, parent=None, name=None):
         modifier.renameNode(node_mob, name)
     modifier.doIt()
 
-    # Renames created shapes.
-    if node_mob.hasFn(OpenMaya.MFn.kTransform):
-        dag = OpenMaya.MFnDagNode(node_mob)
-        for index in range(dag.childCount()):
-            child = dag.child(index)
-            if child.hasFn(OpenMaya.MFn.kShape):
-                modifier.renameNode(child, name + 'Shape')
+    # Renames created shapes. Other nodes never need it.
+    if name is not None and parent is None and node_type in _SHAPE_TYPES:
+        rename_shape(modifier, node_mob, name)
         modifier.doIt()
 
     return node_mob
 
 
+def world_node():
+    # A dag iterator starts at the world, no need to iterate all the nodes.
+    return OpenMaya.MItDag().root()
+
+
+def _h(mobject):
+    # Nodes are compared by hash code, plain ints, rather than MObject ==.
+    return OpenMaya.MObjectHandle(mobject).hashCode()
+
+
+_END = object()
+
+
+def assert_iter_equals(iterable, expected):
+    # Compare nodes in lockstep, failing on the first mismatch without
+    # consuming the rest of the iterator.
+    iterator = iter(iterable)
+    for index, item in enumerate(expected):
+        found = next(iterator, _END)
+        assert found is not _END, 'Missing item at index {}.'.format(index)
+        assert _h(found) == _h(item), 'Unexpected item at index {}.'.format(index)
+    assert next(iterator, _END) is _END, 'Unexpected extra items.'
+
+
 def find_plug(node, name):
     return OpenMaya.MFnDependencyNode(node).findPlug(name, False)
 
-# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-# Tests
 
+def plugs_of(node, *names):
+    # Resolve all plugs by 'node.attribute' path, from one selection list.
+    if node.hasFn(_kDagNode):
+        node_name = OpenMaya.MFnDagNode(node).fullPathName()
+    else:
+        node_name = OpenMaya.MFnDependencyNode(node).name()
+    selection = OpenMaya.MSelectionList()
+    for name in names:
+        selection.add('{}.{}'.format(node_name, name))
+    return [selection.getPlug(index) for index in range(len(names))]
 
-def test_parent():
-    parent = create_node('transform')
-    child = create_node('transform', parent=parent)
-    assert mayawalk.parent(child) == parent
 
+# Modifier shared by `connect`, replaced after each test.
+_MODIFIER = OpenMaya.MDGModifier()
 
-def test_parent_world():
-    world = OpenMaya.MItDependencyNodes(OpenMaya.MFn.kWorld).thisNode()
-    node = create_node('transform')
-    assert mayawalk.parent(node, include_world=False) is None
-    assert mayawalk.parent(node, include_world=True) == world
 
+def connect(source, destination):
+    _MODIFIER.connect(source, destination)
+    _MODIFIER.doIt()
 
-def test_children_any():
-    parent = create_node('transform')
-    child_shape = create_node('nurbsCurve', parent=parent)
-    child_transform = create_node('transform', parent=parent)
-    assert list(mayawalk.children(parent)) == [child_shape, child_transform]
 
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """Don't keep the modifier used by a previous test."""
+    global _MODIFIER
+    yield
+    _MODIFIER = OpenMaya.MDGModifier()  # Don't grow its undo queue forever.
 
-def test_children_filtered():
-    parent = create_node('transform')                    # parent
-    shape = create_node('nurbsCurve', parent=parent)     # |- shape
-    transform = create_node('transform', parent=parent)  # |- transform
 
-    found = list(mayawalk.children(parent, api_type=OpenMaya.MFn.kNurbsCurve))
-    assert found == [shape]
+class NodeBatch(object):
+    """Queue nodes creation on a dag and a dg modifier, executed by doIt()."""
 
+    def __init__(self):
+        self.modifier = OpenMaya.MDagModifier()
+        self.dg_modifier = OpenMaya.MDGModifier()
+        self._shapes = []
 
-def test_siblings_any():
-    parent = create_node('transform')                    # parent
-    node = create_node('transform', parent=parent)       #  |- node
-    transform = create_node('transform', parent=parent)  #  |- transform
-    joint = create_node('joint', parent=parent)          #  |- joint
-    assert list(mayawalk.siblings(node)) == [transform, joint]
+    def create(self, node_type, parent=None, name=None):
+        args = [node_type, parent] if parent is not None else [node_type]
+        if node_type in _DAG_TYPES:
+            modifier = self.modifier
+        else:
+            modifier = self.dg_modifier
 
+        try:
+            node_mob = modifier.createNode(*args)
+        except TypeError:  # invalid node type (or dag type missing from the table)
+            if modifier is self.modifier:
+                raise TypeError('Invalid node type: {}.'.format(node_type))
+            try:  # Try to create a dag node.
+                modifier = self.modifier
+                node_mob = modifier.createNode(*args)
+            except TypeError:  # invalid node type
+                raise TypeError('Invalid node type: {}.'.format(node_type))
+
+        if name is not None:
+            modifier.renameNode(node_mob, name)
+            # The shape does not exist yet, it is renamed by doIt().
+            if parent is None and node_type in _SHAPE_TYPES:
+                self._shapes.append((node_mob, name))
+        return node_mob
+
+    def doIt(self):
+        self.dg_modifier.doIt()
+        self.modifier.doIt()
+        if self._shapes:
+            for node_mob, name in self._shapes:
+                rename_shape(self.modifier, node_mob, name)
+            del self._shapes[:]
+            self.modifier.doIt()
+
+
+@pytest.fixture
+def batch():
+    return NodeBatch()
+
+
+@pytest.fixture(scope='session')
+def make_hierarchy():
+    """Create hierarchies from specs, reused as long as their nodes exist.
+
+    A spec is a tuple of ``(node_type, name, parent_name)`` tuples, parents
+    first. Returns the created nodes by name. Only tests marked reuse_scene
+    keep the nodes created by a previous test.
+    """
+    cache = {}
+
+    def make(spec):
+        handles = cache.get(spec)
+        if handles is None or not all(h.isValid() for h in handles.values()):
+            batch = NodeBatch()
+            nodes = {}
+            for node_type, name, parent_name in spec:
+                parent = nodes[parent_name] if parent_name else None
+                nodes[name] = batch.create(node_type, parent=parent)
+            batch.doIt()
+            handles = cache[spec] = dict(
+                (name, OpenMaya.MObjectHandle(node))
+                for name, node in nodes.items())
+        return dict(
+            (name, handle.object()) for name, handle in handles.items())
+
+    return make
+
+
+_FILTERED_HIERARCHY = (
+    ('transform', 'parent', None),         # parent
+    ('nurbsCurve', 'shape', 'parent'),     #  |- shape
+    ('transform', 'node', 'parent'),       #  |- node
+    ('joint', 'joint', 'parent'),          #  |- joint
+    ('transform', 'grandchild', 'joint'),  #      |- grandchild
+)
+
+_TX_PAIR = (
+    ('transform', 'src', None),  # src
+    ('transform', 'dst', None),  # dst
+)
+
+
+@pytest.fixture
+def tx_pair_connected(make_hierarchy):
+    """Connect src.translateX >> dst.translateY, on nodes from make_hierarchy.
+
+    Returns ``(node_src, node_dst, plug_src, plug_dst)``. Tests marked
+    reuse_scene share the same nodes and connection.
+    """
+    nodes = make_hierarchy(_TX_PAIR)
+    node_src, node_dst = nodes['src'], nodes['dst']
+    plug_src, = plugs_of(node_src, 'translateX')
+    plug_dst, = plugs_of(node_dst, 'translateY')
+    if not plug_dst.isDestination:
+        connect(plug_src, plug_dst)
+    return node_src, node_dst, plug_src, plug_dst
 
-def test_siblings_filtered():
-    parent = create_node('transform')                    # parent
-    node = create_node('transform', parent=parent)       #  |- node
-    transform = create_node('transform', parent=parent)  #  |- transform
-    joint = create_node('joint', parent=parent)          #  |- joint
-    assert list(mayawalk.siblings(node, api_type=OpenMaya.MFn.kJoint)) == [joint]
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# Tests
+
+
+def test_create_node_shape_name(batch):
+    # Both helpers name the shape Maya creates under a named transform.
+    created = [create_node('nurbsCurve', name='direct'),
+               batch.create('nurbsCurve', name='batched')]
+    batch.doIt()
+
+    for node, name in zip(created, ['direct', 'batched']):
+        assert OpenMaya.MFnDagNode(node).name() == name
+        shape = OpenMaya.MFnDagNode(node).child(0)
+        assert OpenMaya.MFnDagNode(shape).name() == name + 'Shape'
+
+
+def test_node_batch_dg_node(batch):
+    node = batch.create('network', name='dg')
+    batch.doIt()
+    assert OpenMaya.MFnDependencyNode(node).name() == 'dg'
 
 
-def test_siblings_world():
-                                        # world
-    node = create_node('transform')     #  |- node
-    sibling = create_node('transform')  #  |- sibling
+def test_parent(batch):
+    parent = batch.create('transform')
+    child = batch.create('transform', parent=parent)
+    batch.doIt()
+    assert _h(mayawalk.parent(child)) == _h(parent)
+
+
+def test_parent_world():
+    world = world_node()
+    node = create_node('transform')
+    assert mayawalk.parent(node, include_world=False) is None
+    assert _h(mayawalk.parent(node, include_world=True)) == _h(world)
+
+
+def test_children_any(batch):
+    parent = batch.create('transform')
+    child_shape = batch.create('nurbsCurve', parent=parent)
+    child_transform = batch.create('transform', parent=parent)
+    batch.doIt()
+    assert_iter_equals(mayawalk.children(parent), [child_shape, child_transform])
+
+
+@pytest.mark.reuse_scene
+@pytest.mark.parametrize('api_type, expected', [
+    (_kNurbsCurve, ['shape']),
+    (_kJoint, ['joint']),
+    (_kTransform, ['node', 'joint']),
+], ids=['nurbsCurve', 'joint', 'transform'])
+def test_children_filtered(make_hierarchy, api_type, expected):
+    nodes = make_hierarchy(_FILTERED_HIERARCHY)
+    found = mayawalk.children(nodes['parent'], api_type=api_type)
+    assert_iter_equals(found, [nodes[name] for name in expected])
+
+
+def test_siblings_any(batch):
+    parent = batch.create('transform')                    # parent
+    node = batch.create('transform', parent=parent)       #  |- node
+    transform = batch.create('transform', parent=parent)  #  |- transform
+    joint = batch.create('joint', parent=parent)          #  |- joint
+    batch.doIt()
+    assert_iter_equals(mayawalk.siblings(node), [transform, joint])
+
+
+@pytest.mark.reuse_scene
+@pytest.mark.parametrize('api_type, expected', [
+    (_kNurbsCurve, ['shape']),
+    (_kJoint, ['joint']),
+    (_kTransform, ['joint']),
+], ids=['nurbsCurve', 'joint', 'transform'])
+def test_siblings_filtered(make_hierarchy, api_type, expected):
+    nodes = make_hierarchy(_FILTERED_HIERARCHY)
+    found = mayawalk.siblings(nodes['node'], api_type=api_type)
+    assert_iter_equals(found, [nodes[name] for name in expected])
+
+
+def test_siblings_world(batch):
+                                         # world
+    sibling = batch.create('transform')  #  |- sibling
+    node = batch.create('transform')     #  |- node
+    batch.doIt()
 
     # Default Maya camera nodes are also siblings of node.
     assert sibling in mayawalk.siblings(node)
 
 
-def test_hierarchy_downstream():
-    root = create_node('transform')                            # root
-    curve_transform = create_node('transform', parent=root)    #  |- curve_transform
-    shape = create_node('nurbsCurve', parent=curve_transform)  #      |- shape
-    transform = create_node('transform', parent=root)          #  |- transform
+def test_hierarchy_downstream(batch):
+    root = batch.create('transform')                            # root
+    curve_transform = batch.create('transform', parent=root)    #  |- curve_transform
+    shape = batch.create('nurbsCurve', parent=curve_transform)  #      |- shape
+    transform = batch.create('transform', parent=root)          #  |- transform
+    batch.doIt()
 
     # Breadth first search
-    breadth_first = list(mayawalk.hierarchy(root, depth_first=False))
-    assert breadth_first == [root, curve_transform, transform, shape]
+    found = mayawalk.hierarchy(root, depth_first=False)
+    assert_iter_equals(found, [root, curve_transform, transform, shape])
 
     # Depth first search
-    depth_first = list(mayawalk.hierarchy(root, depth_first=True))
-    assert depth_first == [root, transform, curve_transform, shape]
+    found = mayawalk.hierarchy(root, depth_first=True)
+    assert_iter_equals(found, [root, transform, curve_transform, shape])
+
 
+def test_hierarchy_upstream(batch):
+    parent = batch.create('transform')                    # parent
+    child = batch.create('transform', parent=parent)      #  |- child
+    grandchild = batch.create('transform', parent=child)  #      |- grandchild
+    batch.doIt()
 
-def test_hierarchy_upstream():
-    parent = create_node('transform')                    # parent
-    child = create_node('transform', parent=parent)      #  |- child
-    grandchild = create_node('transform', parent=child)  #      |- grandchild
+    found = mayawalk.hierarchy(grandchild, upstream=True)
+    assert_iter_equals(found, [grandchild, child, parent])
 
-    found = list(mayawalk.hierarchy(grandchild, upstream=True))
-    assert found == [grandchild, child, parent]
 
+def test_hierarchy_stoppers(batch):
+    parent = batch.create('transform')                   # parent
+    child = batch.create('transform', parent=parent)     #  |- child
+    granchild = batch.create('transform', parent=child)  #      |- grandchild
+    batch.doIt()
+    assert_iter_equals(mayawalk.hierarchy(parent, stoppers=[child]), [parent, child])
 
-def test_hierarchy_stoppers():
-    parent = create_node('transform')                   # parent
-    child = create_node('transform', parent=parent)     #  |- child
-    granchild = create_node('transform', parent=child)  #      |- grandchild
-    assert list(mayawalk.hierarchy(parent, stoppers=[child])) == [parent, child]
 
+def test_hierarchy_max_depth(batch):
+    parent = batch.create('transform')                   # parent
+    child = batch.create('transform', parent=parent)     #  |- child
+    granchild = batch.create('transform', parent=child)  #      |- grandchild
+    batch.doIt()
 
-def test_hierarchy_filtered():
-    parent = create_node('transform')                         # parent
-    child_joint = create_node('joint', parent=parent)         #  |- child_joint
-    granchild = create_node('transform', parent=child_joint)  #      |- grandchild
+    found = mayawalk.hierarchy(parent, max_depth=1, depth_first=False)
+    assert_iter_equals(found, [parent, child])
 
-    found = list(mayawalk.hierarchy(parent, api_type=OpenMaya.MFn.kJoint))
-    assert found == [child_joint]
+    found = mayawalk.hierarchy(parent, max_depth=1, depth_first=True)
+    assert_iter_equals(found, [parent, child])
 
+    found = mayawalk.hierarchy(granchild, max_depth=1, upstream=True)
+    assert_iter_equals(found, [granchild, child])
 
-def test_top_nodes():
-    node_a = create_node('transform')                 # node_a
-    node_b = create_node('transform', parent=node_a)  #  |- node_b
-    node_c = create_node('transform')                 # node_c
-    node_d = create_node('transform', parent=node_c)  #  |- node_d
-    node_e = create_node('transform', parent=node_d)  #      |- node_e
 
-    found = list(mayawalk.top_nodes((node_a, node_b, node_d, node_e)))
-    assert found == [node_a, node_d]
+@pytest.mark.reuse_scene
+@pytest.mark.parametrize('api_type, expected', [
+    (_kNurbsCurve, ['shape']),
+    (_kJoint, ['joint']),
+    (_kTransform, ['parent', 'node', 'joint', 'grandchild']),
+], ids=['nurbsCurve', 'joint', 'transform'])
+def test_hierarchy_filtered(make_hierarchy, api_type, expected):
+    nodes = make_hierarchy(_FILTERED_HIERARCHY)
+    found = mayawalk.hierarchy(nodes['parent'], api_type=api_type)
+    assert_iter_equals(found, [nodes[name] for name in expected])
 
 
-def test_top_nodes_sparse():
-    node_a = create_node('transform')                 # node_a
-    node_b = create_node('transform', parent=node_a)  #  |- node_b
-    node_c = create_node('transform', parent=node_b)  #      |- node_c
+def test_top_nodes(batch):
+    node_a = batch.create('transform')                 # node_a
+    node_b = batch.create('transform', parent=node_a)  #  |- node_b
+    node_c = batch.create('transform')                 # node_c
+    node_d = batch.create('transform', parent=node_c)  #  |- node_d
+    node_e = batch.create('transform', parent=node_d)  #      |- node_e
+    batch.doIt()
 
-    found = list(mayawalk.top_nodes((node_a, node_c), sparse=True))
-    assert found == [node_a]
+    found = mayawalk.top_nodes((node_a, node_b, node_d, node_e))
+    assert_iter_equals(found, [node_a, node_d])
+
+
+def test_top_nodes_input_order(batch):
+    node_a = batch.create('transform')                 # node_a
+    node_b = batch.create('transform', parent=node_a)  #  |- node_b
+    node_c = batch.create('transform')                 # node_c
+    node_d = batch.create('transform', parent=node_c)  #  |- node_d
+    batch.doIt()
+
+    # Top nodes are yielded in input order, not in depth or creation order.
+    found = mayawalk.top_nodes((node_d, node_b, node_a))
+    assert_iter_equals(found, [node_d, node_a])
+
+
+def test_top_nodes_sparse(batch):
+    node_a = batch.create('transform')                 # node_a
+    node_b = batch.create('transform', parent=node_a)  #  |- node_b
+    node_c = batch.create('transform', parent=node_b)  #      |- node_c
+    batch.doIt()
+
+    found = mayawalk.top_nodes((node_a, node_c), sparse=True)
+    assert_iter_equals(found, [node_a])
+
+
+def test_top_nodes_sparse_shared_ancestors(batch):
+    node_a = batch.create('transform')                 # node_a
+    node_b = batch.create('transform', parent=node_a)  #  |- node_b
+    node_c = batch.create('transform', parent=node_b)  #      |- node_c
+    node_d = batch.create('transform', parent=node_b)  #      |- node_d
+    node_e = batch.create('transform')                 # node_e
+    node_f = batch.create('transform', parent=node_e)  #  |- node_f
+    batch.doIt()
+
+    found = mayawalk.top_nodes((node_c, node_d, node_f, node_a), sparse=True)
+    assert_iter_equals(found, [node_f, node_a])
 
 
 def test_plug_parent():
@@ -167,23 +430,24 @@ def test_plug_parent():
 def test_plug_children():
     node = OpenMaya.MFnDependencyNode(create_node('transform'))
     translate = node.findPlug('translate', False)
-    children = [node.findPlug('translate' + axis, False) for axis in 'XYZ']
+    children = [node.findPlug(name, False) for name in _TRANSLATE_XYZ]
     assert list(mayawalk.plug_children(translate)) == children
 
 
 def test_plug_children_reverse():
     node = OpenMaya.MFnDependencyNode(create_node('transform'))
     translate = node.findPlug('translate', False)
-    children = [node.findPlug('translate' + axis, False) for axis in 'ZYX']
+    children = [node.findPlug(name, False) for name in _TRANSLATE_ZYX]
     assert list(mayawalk.plug_children(translate, reverse=True)) == children
 
 
-def test_plugs():
-    node_src = create_node('transform')
-    node_dst = create_node('transform')
-    plug_src = find_plug(node_src, 'translateX')
-    plug_dst = find_plug(node_dst, 'translateY')
-    OpenMaya.MDGModifier().connect(plug_src, plug_dst).doIt()
+def test_plugs(batch):
+    node_src = batch.create('transform')
+    node_dst = batch.create('transform')
+    batch.doIt()
+    plug_src, = plugs_of(node_src, 'translateX')
+    plug_dst, = plugs_of(node_dst, 'translateY')
+    connect(plug_src, plug_dst)
 
     status = mayawalk.ConnectionStatus
 
@@ -203,35 +467,161 @@ def test_plugs():
     assert plug_src in mayawalk.plugs(node_src, status.kDisconnectedSources)
 
 
-def test_connected():
-    src = create_node('transform')
-    dst = create_node('transform')
+def test_plugs_nested_array_element(batch):
+    node_src = batch.create('transform')
+    node_dst = batch.create('transform')
+    batch.doIt()
+
+    def object_group_id(node):
+        dep = OpenMaya.MFnDependencyNode(node)
+        plug = dep.findPlug('instObjGroups', False).elementByLogicalIndex(0)
+        plug = plug.child(dep.attribute('objectGroups')).elementByLogicalIndex(0)
+        return plug.child(dep.attribute('objectGroupId'))
+
+    # instObjGroups[0].objectGroups[0].objectGroupId >> (same plug)
+    connect(object_group_id(node_src), object_group_id(node_dst))
+
+    status = mayawalk.ConnectionStatus
+    names = set(plug.name() for plug in mayawalk.plugs(node_src))
+    connected = set(p.name() for p in mayawalk.plugs(node_src, status.kConnected))
+    disconnected = set(p.name() for p in mayawalk.plugs(node_src, status.kDisconnected))
+
+    # Nested array plugs are not yielded, whatever the connection status.
+    assert connected == set()
+    assert connected | disconnected == names
+    assert list(mayawalk.connected(node_src)) == []
+
+
+def test_plugs_dynamic_attribute(batch):
+    node = batch.create('transform')
+    node_dynamic = batch.create('transform')
+    batch.doIt()
+
+    # Cache the transform normal attributes.
+    list(mayawalk.plugs(node))
+
+    # Add a dynamic attribute after the cached attributes.
+    mattribute = OpenMaya.MFnNumericAttribute()
+    attr_obj = mattribute.create('dynamic', 'dynamic', OpenMaya.MFnNumericData.kShort)
+    OpenMaya.MDGModifier().addAttribute(node_dynamic, attr_obj).doIt()
+    dynamic = find_plug(node_dynamic, 'dynamic')
+
+    assert dynamic in mayawalk.plugs(node_dynamic)
+    assert not any(p.partialName() == 'dynamic' for p in mayawalk.plugs(node))
+
+
+def test_plugs_stale_attributes_cache():
+    node = create_node('transform')
+    expected = [plug.name() for plug in mayawalk.plugs(node)]
+
+    # Replace the last cached attribute, as if the type was recreated.
+    type_id = OpenMaya.MFnDependencyNode(node).typeId.id()
+    cached = mayawalk._normal_attributes[type_id]
+    mayawalk._normal_attributes[type_id] = cached[:-1] + cached[:1]
+
+    assert [plug.name() for plug in mayawalk.plugs(node)] == expected
+    assert mayawalk._normal_attributes[type_id] == cached
+
+
+def test_connected(batch):
+    src = batch.create('transform')
+    dst = batch.create('transform')
+    batch.doIt()
 
     # source >> destination
-    modifier = OpenMaya.MDGModifier()
-    modifier.connect(find_plug(src, 'translateX'), find_plug(dst, 'translateY'))
-    modifier.doIt()
+    plug_src, = plugs_of(src, 'translateX')
+    plug_dst, = plugs_of(dst, 'translateY')
+    connect(plug_src, plug_dst)
 
     # Connected sources
-    assert list(mayawalk.connected(src, sources=False, destinations=True)) == [dst]
-    assert list(mayawalk.connected(dst, sources=True, destinations=False)) == [src]
+    found = mayawalk.connected(src, sources=False, destinations=True)
+    assert_iter_equals(found, [dst])
+    found = mayawalk.connected(dst, sources=True, destinations=False)
+    assert_iter_equals(found, [src])
 
 
-def test_connections_visite_once():
-    node_src = create_node('transform')
-    node_dst = create_node('transform')
+def test_connected_sources_and_destinations(batch):
+    src = batch.create('transform')
+    node = batch.create('transform')
+    dst = batch.create('transform')
+    batch.doIt()
 
-    plug_src = find_plug(node_src, 'translateX')
-    plug_dst = find_plug(node_dst, 'translateY')
-    plug_loop = find_plug(node_src, 'translateZ')
+    # source >> node >> destination
+    src_x, = plugs_of(src, 'translateX')
+    node_x, node_y = plugs_of(node, 'translateX', 'translateY')
+    dst_y, = plugs_of(dst, 'translateY')
+    connect(src_x, node_x)
+    connect(node_y, dst_y)
 
-    # source >> destination >> source
-    modifier = OpenMaya.MDGModifier()
-    modifier.connect(plug_src, plug_dst)
-    modifier.connect(plug_dst, plug_loop)
-    modifier.doIt()
+    assert_iter_equals(mayawalk.connected(node), [src, dst])
 
-    assert list(mayawalk.connections(node_src)) == [node_src, node_dst]
+
+def test_connections_visite_once(batch):
+    node_src = batch.create('transform')
+    node_dst = batch.create('transform')
+    batch.doIt()
+
+    plug_src, plug_loop = plugs_of(node_src, 'translateX', 'translateZ')
+    plug_dst, = plugs_of(node_dst, 'translateY')
+
+    # source >> destination >> source
+    connect(plug_src, plug_dst)
+    connect(plug_dst, plug_loop)
+
+    assert_iter_equals(mayawalk.connections(node_src), [node_src, node_dst])
+
+
+def test_connections_breadth_first_diamond(batch):
+    node_a = batch.create('transform')
+    node_b = batch.create('transform')
+    node_c = batch.create('transform')
+    node_d = batch.create('transform')
+    batch.doIt()
+
+    a_x, a_y = plugs_of(node_a, 'translateX', 'translateY')
+    b_y, b_z = plugs_of(node_b, 'translateY', 'translateZ')
+    c_z, c_x = plugs_of(node_c, 'translateZ', 'translateX')
+    d_x, d_y = plugs_of(node_d, 'translateX', 'translateY')
+
+    # a >> b >> c >> d, and a >> d. Whatever the order a connections are
+    # queried, d is reached before c is visited, so it is deferred (with its
+    # connections cached) until c, its other source, is visited.
+    connect(a_y, b_y)
+    connect(b_z, c_z)
+    connect(c_x, d_x)
+    connect(a_x, d_y)
+
+    found = mayawalk.connections(node_a)
+    assert_iter_equals(found, [node_a, node_b, node_c, node_d])
+
+    found = mayawalk.connections(node_d, upstream=True)
+    assert_iter_equals(found, [node_d, node_c, node_b, node_a])
+
+
+def test_connections_breadth_first_stoppers(batch):
+    node_a = batch.create('transform')
+    node_b = batch.create('transform')
+    node_c = batch.create('transform')
+    node_d = batch.create('transform')
+    node_e = batch.create('transform')
+    batch.doIt()
+
+    a_x, a_y = plugs_of(node_a, 'translateX', 'translateY')
+    b_y, b_z = plugs_of(node_b, 'translateY', 'translateZ')
+    c_z, c_x = plugs_of(node_c, 'translateZ', 'translateX')
+    d_x, d_y, d_z = plugs_of(node_d, 'translateX', 'translateY', 'translateZ')
+    e_z, = plugs_of(node_e, 'translateZ')
+
+    # a >> b >> c >> d >> e, and a >> d. d is deferred, then visited as a
+    # stopper, so e is never reached.
+    connect(a_y, b_y)
+    connect(b_z, c_z)
+    connect(c_x, d_x)
+    connect(a_x, d_y)
+    connect(d_z, e_z)
+
+    found = mayawalk.connections(node_a, stoppers=[node_d])
+    assert_iter_equals(found, [node_a, node_b, node_c, node_d])
 
 # TODO write more tests for mayawalk.connections
 
@@ -267,37 +657,57 @@ def test_plug_children_array():
     assert list(mayawalk.plug_children(array)) == [index_1, index_3]
 
 
-def test_plug_has_source():
-    node_src = create_node('transform')
-    node_dst = create_node('transform')
-    plug_src = find_plug(node_src, 'translateX')
-    plug_dst = find_plug(node_dst, 'translateY')
-    OpenMaya.MDGModifier().connect(plug_src, plug_dst).doIt()
+def test_plug_children_array_readded():
+    node = create_node('transform')
+    modifier = OpenMaya.MDGModifier()
+
+    # Add a connectable array of int, with existing elements.
+    mattribute = OpenMaya.MFnNumericAttribute()
+    attr_obj = mattribute.create('array', 'array', OpenMaya.MFnNumericData.kShort)
+    mattribute.array = True
+    modifier.addAttribute(node, attr_obj).doIt()
+    array = find_plug(node, 'array')
+    modifier.connect(array.elementByLogicalIndex(0),
+                     array.elementByLogicalIndex(1)).doIt()
+    assert list(mayawalk.plug_children(array))
+
+    # Replace it with a non-connectable array, whose hash can be reused.
+    modifier = OpenMaya.MDGModifier()
+    modifier.removeAttribute(node, attr_obj).doIt()
+    attr_obj = mattribute.create('array', 'array', OpenMaya.MFnNumericData.kShort)
+    mattribute.array = True
+    mattribute.connectable = False
+    modifier.addAttribute(node, attr_obj).doIt()
+
+    assert list(mayawalk.plug_children(find_plug(node, 'array'))) == []
+
+
+@pytest.mark.reuse_scene
+def test_plug_has_source(tx_pair_connected):
+    _, _, _, plug_dst = tx_pair_connected
     assert mayawalk.plug_has_source(plug_dst)
 
 
-def test_plug_has_source_nested():
-    node_src = create_node('transform')
-    node_dst = create_node('transform')
-    plug_src = find_plug(node_src, 'translateX')
-    plug_dst = find_plug(node_dst, 'translateY')
-    OpenMaya.MDGModifier().connect(plug_src, plug_dst).doIt()
-    assert mayawalk.plug_has_source(find_plug(node_dst, 'translate'), nested=True)
+@pytest.mark.reuse_scene
+def test_plug_has_source_nested(tx_pair_connected):
+    _, _, _, plug_dst = tx_pair_connected
+    assert mayawalk.plug_has_source(plug_dst.parent(), nested=True)
 
 
-def test_plug_has_destinations():
-    node_src = create_node('transform')
-    node_dst = create_node('transform')
-    plug_src = find_plug(node_src, 'translateX')
-    plug_dst = find_plug(node_dst, 'translateY')
-    OpenMaya.MDGModifier().connect(plug_src, plug_dst).doIt()
+@pytest.mark.reuse_scene
+def test_plug_has_destinations(tx_pair_connected):
+    _, _, plug_src, _ = tx_pair_connected
     assert mayawalk.plug_has_destinations(plug_src)
 
 
-def test_plug_has_destinations_nested():
-    node_src = create_node('transform')
-    node_dst = create_node('transform')
-    plug_src = find_plug(node_src, 'translateX')
-    plug_dst = find_plug(node_dst, 'translateY')
-    OpenMaya.MDGModifier().connect(plug_src, plug_dst).doIt()
-    assert mayawalk.plug_has_destinations(find_plug(node_src, 'translate'), nested=True)
+@pytest.mark.reuse_scene
+def test_plug_has_destinations_nested(tx_pair_connected):
+    _, _, plug_src, _ = tx_pair_connected
+    assert mayawalk.plug_has_destinations(plug_src.parent(), nested=True)
+
+
+@pytest.mark.reuse_scene
+def test_plug_has_connections_nested(tx_pair_connected):
+    _, _, plug_src, plug_dst = tx_pair_connected
+    assert mayawalk.plug_has_connections(plug_src.parent(), nested=True)
+    assert mayawalk.plug_has_connections(plug_dst.parent(), nested=True)